@@ -0,0 +1,132 @@
+import os
+import queue
+import threading
+import logging
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Shared source of zero bytes for filling in dropped data
+_ZERO_BLOCK = bytes(1024 * 1024)
+
+# Most buffers passed to a single writev call (Linux IOV_MAX)
+_IOV_MAX = 1024
+
+def _zeros(count: int) -> Iterator[memoryview]:
+    """Yield views of the shared zero block totalling count bytes"""
+    view = memoryview(_ZERO_BLOCK)
+    while count > 0:
+        piece = min(count, len(_ZERO_BLOCK))
+        yield view[:piece]
+        count -= piece
+
+class BatchWriter:
+    """Background writer that appends queued buffers to raw file descriptors
+    
+    Producers only enqueue; a daemon thread drains everything that is pending
+    in one pass, so disk writes overlap with voice decoding instead of running
+    on the caller's thread. The queue is bounded: when the disk falls behind,
+    new data is dropped rather than stalling the producer, and the same number
+    of zero bytes is written in its place once the writer catches up, so file
+    offsets (e.g. sample positions in raw PCM) are preserved.
+    """
+    
+    def __init__(self, name: str = 'batch-writer', max_batch: int = 256, max_pending: int = 1024):
+        self.max_batch = max_batch
+        self.dropped = 0
+        # Bytes dropped per descriptor that still have to be written as zeros
+        self._gaps: Dict[int, int] = {}
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+    
+    def submit(self, fd: int, data: bytes, block: bool = False) -> bool:
+        """Queue data to be appended to fd; returns False if it had to be dropped
+        
+        Dropped data is zero-filled ahead of the next buffer queued for fd.
+        With block=True the call waits for queue space instead of dropping,
+        for data that must not be lost (e.g. the final flush at shutdown).
+        """
+        if self._closed:
+            raise RuntimeError("BatchWriter is closed")
+        gap = self._gaps.pop(fd, 0)
+        try:
+            self._queue.put((fd, data, gap), block=block)
+            return True
+        except queue.Full:
+            self._gaps[fd] = gap + len(data)
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 100 == 0:
+                logger.warning(f"{self._thread.name}: write queue full, zero-filled {self.dropped} buffers so far")
+            return False
+    
+    def close(self):
+        """Write any pending data and stop the writer thread"""
+        if self._closed:
+            return
+        self._closed = True
+        
+        # Fill in data dropped after the last buffer that made it into the queue
+        for fd, gap in self._gaps.items():
+            self._queue.put((fd, b'', gap))
+        self._gaps.clear()
+        
+        self._queue.put(None)
+        self._thread.join()
+        if self.dropped:
+            logger.warning(f"{self._thread.name}: zero-filled {self.dropped} dropped buffers in total")
+    
+    def _run(self):
+        """Drain the queue in batches until close() is called"""
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            if not self._process_batch(batch):
+                return
+    
+    def _process_batch(self, batch: List[Optional[Tuple[int, bytes, int]]]) -> bool:
+        """Write one batch in order; returns False once the stop sentinel is seen"""
+        pending: Dict[int, List[bytes]] = {}
+        for op in batch:
+            if op is None:
+                # Everything queued before the sentinel must be on disk first
+                self._write_pending(pending)
+                return False
+            
+            fd, data, gap = op
+            buffers = pending.setdefault(fd, [])
+            if gap:
+                buffers.extend(_zeros(gap))
+            if data:
+                buffers.append(data)
+        
+        self._write_pending(pending)
+        return True
+    
+    def _write_pending(self, pending: Dict[int, List[bytes]]):
+        """Gather each descriptor's queued buffers into as few writev calls as possible"""
+        for fd, buffers in pending.items():
+            try:
+                for start in range(0, len(buffers), _IOV_MAX):
+                    self._writev_all(fd, buffers[start:start + _IOV_MAX])
+            except OSError as e:
+                logger.error(f"Failed to write {sum(len(b) for b in buffers)} bytes to fd {fd}: {e}")
+    
+    @staticmethod
+    def _writev_all(fd: int, buffers: List[bytes]):
+        """Write buffers to fd, finishing any short write with plain writes"""
+        written = os.writev(fd, buffers)
+        for data in buffers:
+            if written >= len(data):
+                written -= len(data)
+                continue
+            view = memoryview(data)[written:]
+            written = 0
+            while view:
+                view = view[os.write(fd, view):]
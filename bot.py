@@ -1,11 +1,11 @@
 import discord
 from discord.ext import commands, tasks
+from cachetools import TTLCache
 import asyncio
 import logging
 import os
 import tempfile
 import time
-from datetime import datetime, timedelta
 from typing import Dict, Optional
 from pathlib import Path
 
@@ -43,15 +43,20 @@ class VoiceRecordingBot(commands.Bot):
         
         # Recording state
         self.active_recordings: Dict[int, Dict] = {}  # guild_id -> recording_info
+        self.recording_id_to_guild: Dict[int, int] = {}  # recording_id -> guild_id
         self.recording_tasks: Dict[int, asyncio.Task] = {}  # guild_id -> processing_task
         
-        # Ensure recordings directory exists
-        os.makedirs(self.config.RECORDINGS_PATH, exist_ok=True)
+        # Query caches: completed recordings are immutable, listings change on start/finish
+        self.recording_cache = TTLCache(maxsize=1024, ttl=3600)  # recording_id -> recording
+        self.listing_cache = TTLCache(maxsize=256, ttl=30)  # (guild_id, page, limit) -> recordings
     
     async def setup_hook(self):
         """Setup hook called when bot starts"""
         logger.info("Setting up bot...")
         
+        # Ensure recordings directory exists
+        await asyncio.to_thread(os.makedirs, self.config.RECORDINGS_PATH, exist_ok=True)
+        
         try:
             # Initialize database
             await self.db.initialize()
@@ -130,22 +135,32 @@ class VoiceRecordingBot(commands.Bot):
             return
         
         # Update participant list if someone joins/leaves the recorded channel
-        if recording_info['voice_client'] and recording_info['voice_client'].channel:
-            if before.channel == recording_info['voice_client'].channel or after.channel == recording_info['voice_client'].channel:
-                await self.update_recording_participants(guild_id)
+        voice_client = recording_info['voice_client']
+        if voice_client and voice_client.channel:
+            if before.channel == voice_client.channel or after.channel == voice_client.channel:
+                await self.update_recording_participants(guild_id, member, after.channel == voice_client.channel)
     
-    async def update_recording_participants(self, guild_id: int):
-        """Update the participant list for an active recording"""
-        if guild_id not in self.active_recordings:
+    async def update_recording_participants(self, guild_id: int, member, in_channel: bool):
+        """Apply one member's join/leave to the participant list of an active recording"""
+        if guild_id not in self.active_recordings or member.bot:
             return
         
         recording_info = self.active_recordings[guild_id]
-        voice_client = recording_info['voice_client']
+        participant_names = recording_info['participant_names']
         
-        if voice_client and voice_client.channel:
-            participants = [member.display_name for member in voice_client.channel.members if not member.bot]
-            recording_info['participants'] = participants
-            logger.info(f"Updated participants for recording {recording_info['recording_id']}: {participants}")
+        if in_channel:
+            participant_names[member.id] = member.display_name
+        else:
+            participant_names.pop(member.id, None)
+        
+        participants = list(participant_names.values())
+        recording_info['participants'] = participants
+        logger.info(f"Updated participants for recording {recording_info['recording_id']}: {participants}")
+    
+    def invalidate_guild_listings(self, guild_id: int):
+        """Drop cached /recordings pages for a guild"""
+        for key in [key for key in list(self.listing_cache.keys()) if key[0] == guild_id]:
+            self.listing_cache.pop(key, None)
     
     async def stop_recording(self, guild_id: int):
         """Stop recording for a guild"""
@@ -178,6 +193,9 @@ class VoiceRecordingBot(commands.Bot):
             # Clean up
             if guild_id in self.active_recordings:
                 del self.active_recordings[guild_id]
+            # Processing has finished, so the guild's listing is stale
+            self.invalidate_guild_listings(guild_id)
+            self.recording_id_to_guild.pop(recording_id, None)
     
     async def process_recording(self, recording_info: Dict):
         """Process a completed recording"""
@@ -197,9 +215,8 @@ class VoiceRecordingBot(commands.Bot):
                 user_audio_files, recording_id, participants
             )
             
-            # Calculate duration
-            start_time = recording_info['start_time']
-            duration = int((datetime.utcnow() - start_time).total_seconds())
+            # Calculate duration on the monotonic clock, immune to wall-clock jumps
+            duration = int(time.monotonic() - recording_info['start_monotonic'])
             
             # Update database
             await self.db.finish_recording(
@@ -245,9 +262,6 @@ class VoiceRecordingBot(commands.Bot):
             # Clean up expired tokens from file server memory
             expired_count = self.file_server.cleanup_expired_tokens()
             
-            # Clean up temporary files
-            self.audio_processor.cleanup_temp_files()
-            
             logger.info(f"Cleanup task completed. Cleaned {expired_count} expired tokens.")
             
         except Exception as e:
@@ -257,9 +271,11 @@ class VoiceRecordingBot(commands.Bot):
         """Clean shutdown"""
         logger.info("Shutting down bot...")
         
-        # Stop all active recordings
-        for guild_id in list(self.active_recordings.keys()):
-            await self.stop_recording(guild_id)
+        # Stop all active recordings concurrently; one failure shouldn't block the rest
+        await asyncio.gather(
+            *[self.stop_recording(guild_id) for guild_id in list(self.active_recordings.keys())],
+            return_exceptions=True
+        )
         
         # Cancel cleanup task
         if hasattr(self, 'cleanup_task'):
@@ -274,6 +290,14 @@ class VoiceRecordingBot(commands.Bot):
         
         logger.info("Bot shutdown complete")
 
+# Run the bot (and the file server sharing its loop) on uvloop where available;
+# the client picks up its event loop when it is constructed below
+try:
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+except ImportError:
+    pass
+
 # Create bot instance
 bot = VoiceRecordingBot()
 
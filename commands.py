@@ -5,22 +5,53 @@ import logging
 import asyncio
 import tempfile
 import os
+import time
+import threading
 from datetime import datetime, timedelta
 from typing import Dict, List
 
+from batch_writer import BatchWriter
 from bot import bot
-from config import get_config
 
 logger = logging.getLogger(__name__)
 
-class RecordingSink(discord.sinks.WaveSink):
-    """Custom recording sink for multi-user audio capture"""
+# Embed colors, built once instead of per command
+_GREEN = discord.Color.green()
+_ORANGE = discord.Color.orange()
+_BLUE = discord.Color.blue()
+
+# Permission bits tested directly against Permissions.value
+_PERM_MANAGE_MESSAGES = discord.Permissions.manage_messages.flag
+
+# Upper bound for a single coalesced sink write
+MAX_WRITE_BLOCK = 1024 * 1024
+
+class RecordingSink(discord.sinks.Sink):
+    """Custom recording sink for multi-user audio capture
+    
+    Each user's decoded audio is appended as raw 48kHz stereo s16le PCM;
+    AudioProcessor consumes these files directly, so no WAV header is written.
+    """
     
     def __init__(self, recording_id: int):
         super().__init__()
         self.recording_id = recording_id
         self.temp_dir = tempfile.mkdtemp(prefix=f"recording_{recording_id}_")
-        self.user_files = {}
+        # Per-user state lives in parallel lists indexed through uid_to_idx,
+        # keeping the per-packet path to one dict lookup
+        self.uid_to_idx: Dict[int, int] = {}
+        self.user_ids: List[int] = []
+        self.fds: List[int] = []
+        self.bufs: List[bytearray] = []
+        self.paths: List[str] = []
+        self.users: List = []
+        self.writer = BatchWriter(name=f"recording-{recording_id}-writer")
+        # Coalesce ~20ms voice packets into filesystem-sized appends
+        self.block_size = min(os.statvfs(self.temp_dir).f_bsize * 16, MAX_WRITE_BLOCK)
+        self._user_audio_files = None
+        # Set once cleanup starts; the decoder thread may still deliver packets after that
+        self._finished = False
+        self._write_lock = threading.Lock()
         logger.info(f"Created recording sink for recording {recording_id}")
     
     def write(self, data, user):
@@ -28,39 +59,86 @@ class RecordingSink(discord.sinks.WaveSink):
         if user is None:
             return
         
-        # Create file for user if not exists
-        if user.id not in self.user_files:
-            file_path = os.path.join(self.temp_dir, f"user_{user.id}.wav")
-            self.user_files[user.id] = {
-                'file': open(file_path, 'wb'),
-                'path': file_path,
-                'user': user
-            }
-            logger.info(f"Started recording for user {user.display_name} (ID: {user.id})")
-        
-        # Write audio data
-        self.user_files[user.id]['file'].write(data)
+        with self._write_lock:
+            if self._finished:
+                return
+            
+            idx = self.uid_to_idx.get(user.id)
+            if idx is None:
+                idx = self._add_user(user)
+            
+            # Buffer audio data and hand full blocks to the background writer
+            buf = self.bufs[idx]
+            buf.extend(data)
+            if len(buf) >= self.block_size:
+                self.writer.submit(self.fds[idx], bytes(buf))
+                buf.clear()
+    
+    def _add_user(self, user) -> int:
+        """Create the output file for a newly heard user and return their index"""
+        file_path = os.path.join(self.temp_dir, f"user_{user.id}.pcm")
+        idx = len(self.fds)
+        self.fds.append(os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644))
+        self.bufs.append(bytearray())
+        self.paths.append(file_path)
+        self.users.append(user)
+        self.user_ids.append(user.id)
+        self.uid_to_idx[user.id] = idx
+        logger.info(f"Started recording for user {user.display_name} (ID: {user.id})")
+        return idx
     
     def cleanup(self):
         """Clean up recording files"""
+        # Both the voice client and the finished callback call this; only clean up once
+        if self._user_audio_files is not None:
+            return self._user_audio_files
+        
+        # Stop accepting packets; any write() already in progress finishes first
+        with self._write_lock:
+            self._finished = True
+        
+        # Flush partial buffers and drain pending writes before closing descriptors;
+        # the tail of each track must not be dropped even if the queue is full
+        for fd, buf in zip(self.fds, self.bufs):
+            if buf:
+                self.writer.submit(fd, bytes(buf), block=True)
+                buf.clear()
+        self.writer.close()
+        
+        for fd in self.fds:
+            os.close(fd)
+        
+        # One directory scan gives every file's size without a stat per path
+        with os.scandir(self.temp_dir) as it:
+            entries = {entry.name: entry for entry in it}
+        
         user_audio_files = {}
+        empty_files = []
         
-        for user_id, file_info in self.user_files.items():
-            file_info['file'].close()
+        for user_id, path in zip(self.user_ids, self.paths):
+            entry = entries.get(os.path.basename(path))
             
             # Check if file has content
-            if os.path.getsize(file_info['path']) > 0:
-                user_audio_files[str(user_id)] = file_info['path']
+            if entry is not None and entry.stat(follow_symlinks=False).st_size > 0:
+                user_audio_files[str(user_id)] = path
             else:
-                # Remove empty files
-                try:
-                    os.remove(file_info['path'])
-                except:
-                    pass
+                empty_files.append(path)
         
+        # Remove empty files
+        for path in empty_files:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        
+        self._user_audio_files = user_audio_files
         logger.info(f"Recording cleanup complete. Valid files: {len(user_audio_files)}")
         return user_audio_files
 
+async def _send_error(interaction: discord.Interaction, message: str):
+    """Send an ephemeral error reply to a deferred interaction"""
+    await interaction.followup.send(f"❌ {message}", ephemeral=True)
+
 @bot.tree.command(name="ping", description="Test bot responsiveness")
 async def ping(interaction: discord.Interaction):
     """Test command to check bot responsiveness"""
@@ -76,10 +154,7 @@ async def join_command(interaction: discord.Interaction):
     
     # Check if user is in a voice channel
     if not interaction.user.voice or not interaction.user.voice.channel:
-        await interaction.followup.send(
-            "❌ You need to be in a voice channel to start recording!",
-            ephemeral=True
-        )
+        await _send_error(interaction, "You need to be in a voice channel to start recording!")
         return
     
     guild_id = interaction.guild.id
@@ -90,7 +165,7 @@ async def join_command(interaction: discord.Interaction):
         embed = discord.Embed(
             title="Already Recording",
             description=f"Already recording in <#{active_recording['channel_id']}>",
-            color=discord.Color.orange()
+            color=_ORANGE
         )
         embed.add_field(name="Recording ID", value=active_recording['recording_id'], inline=True)
         embed.add_field(name="Started by", value=f"<@{active_recording['started_by']}>", inline=True)
@@ -117,7 +192,8 @@ async def join_command(interaction: discord.Interaction):
         voice_client.start_recording(sink, lambda s, c: asyncio.create_task(recording_finished(s, c, recording_id)))
         
         # Store recording info
-        participants = [member.display_name for member in voice_client.channel.members if not member.bot]
+        participant_names = {member.id: member.display_name for member in voice_client.channel.members if not member.bot}
+        participants = list(participant_names.values())
         bot.active_recordings[guild_id] = {
             'recording_id': recording_id,
             'voice_client': voice_client,
@@ -125,15 +201,19 @@ async def join_command(interaction: discord.Interaction):
             'channel_id': interaction.user.voice.channel.id,
             'started_by': interaction.user.id,
             'start_time': datetime.utcnow(),
+            'start_monotonic': time.monotonic(),
             'participants': participants,
+            'participant_names': participant_names,  # member_id -> display name, kept current by voice state events
             'channel': interaction.channel
         }
+        bot.recording_id_to_guild[recording_id] = guild_id
+        bot.invalidate_guild_listings(guild_id)
         
         # Send confirmation
         embed = discord.Embed(
             title="🎙️ Recording Started",
             description=f"Recording conversation in **{interaction.user.voice.channel.name}**",
-            color=discord.Color.green()
+            color=_GREEN
         )
         embed.add_field(name="Recording ID", value=recording_id, inline=True)
         embed.add_field(name="Participants", value=", ".join(participants) if participants else "None", inline=True)
@@ -145,10 +225,7 @@ async def join_command(interaction: discord.Interaction):
         
     except Exception as e:
         logger.error(f"Error starting recording: {e}")
-        await interaction.followup.send(
-            "❌ Failed to start recording. Please try again.",
-            ephemeral=True
-        )
+        await _send_error(interaction, "Failed to start recording. Please try again.")
 
 @bot.tree.command(name="stop", description="Stop the current recording")
 async def stop_command(interaction: discord.Interaction):
@@ -159,10 +236,7 @@ async def stop_command(interaction: discord.Interaction):
     
     # Check if recording in this guild
     if guild_id not in bot.active_recordings:
-        await interaction.followup.send(
-            "❌ No active recording in this server.",
-            ephemeral=True
-        )
+        await _send_error(interaction, "No active recording in this server.")
         return
     
     recording_info = bot.active_recordings[guild_id]
@@ -170,11 +244,8 @@ async def stop_command(interaction: discord.Interaction):
     
     # Check if user can stop recording (started by them or has manage messages permission)
     if (interaction.user.id != recording_info['started_by'] and 
-        not interaction.user.guild_permissions.manage_messages):
-        await interaction.followup.send(
-            "❌ You can only stop recordings you started, or you need 'Manage Messages' permission.",
-            ephemeral=True
-        )
+        not interaction.user.guild_permissions.value & _PERM_MANAGE_MESSAGES):
+        await _send_error(interaction, "You can only stop recordings you started, or you need 'Manage Messages' permission.")
         return
     
     try:
@@ -182,7 +253,7 @@ async def stop_command(interaction: discord.Interaction):
         embed = discord.Embed(
             title="🛑 Stopping Recording",
             description=f"Recording #{recording_id} is being stopped and processed...",
-            color=discord.Color.orange()
+            color=_ORANGE
         )
         await interaction.followup.send(embed=embed)
         
@@ -193,10 +264,17 @@ async def stop_command(interaction: discord.Interaction):
         
     except Exception as e:
         logger.error(f"Error stopping recording: {e}")
-        await interaction.followup.send(
-            "❌ Failed to stop recording. Please try again.",
-            ephemeral=True
-        )
+        await _send_error(interaction, "Failed to stop recording. Please try again.")
+
+def _format_recording_line(recording: Dict) -> str:
+    """Format a recording as a single line for the /recordings listing"""
+    status_emoji = "✅" if recording['status'] == 'completed' else "🔄"
+    duration = recording['duration'] or 0
+    file_size = recording['file_size'] or 0
+    file_size_str = f"{file_size / (1024*1024):.1f} MB" if file_size > 0 else "N/A"
+    return (f"{status_emoji} **#{recording['id']}** · {recording['channel_name']} · "
+            f"{recording['started_by_name']} · {duration // 60}:{duration % 60:02d} · "
+            f"{file_size_str} · {recording['start_time'][:10]}")
 
 @bot.tree.command(name="recordings", description="List all recordings for this server")
 async def recordings_command(interaction: discord.Interaction, page: int = 1):
@@ -209,50 +287,31 @@ async def recordings_command(interaction: discord.Interaction, page: int = 1):
     
     try:
         # Get recordings from database
-        recordings = await bot.db.get_guild_recordings(guild_id, limit, offset)
+        cache_key = (guild_id, page, limit)
+        recordings = bot.listing_cache.get(cache_key)
+        if recordings is None:
+            recordings = await bot.db.get_guild_recordings(guild_id, limit, offset)
+            bot.listing_cache[cache_key] = recordings
         
         if not recordings:
             embed = discord.Embed(
                 title="📼 No Recordings",
                 description="No recordings found for this server.",
-                color=discord.Color.blue()
+                color=_BLUE
             )
             await interaction.followup.send(embed=embed)
             return
         
-        # Create embed
+        # Render the whole page as one description instead of a field per recording
+        lines = [f"Page {page} • Showing {len(recordings)} recordings", ""]
+        lines.extend(_format_recording_line(recording) for recording in recordings)
+        
         embed = discord.Embed(
             title="📼 Server Recordings",
-            description=f"Page {page} • Showing {len(recordings)} recordings",
-            color=discord.Color.blue()
+            description="\n".join(lines),
+            color=_BLUE
         )
         
-        for recording in recordings:
-            status_emoji = "✅" if recording['status'] == 'completed' else "🔄"
-            
-            # Format duration
-            duration = recording['duration'] if recording['duration'] else 0
-            duration_str = f"{duration // 60}:{duration % 60:02d}"
-            
-            # Format file size
-            file_size = recording['file_size'] if recording['file_size'] else 0
-            file_size_str = f"{file_size / (1024*1024):.1f} MB" if file_size > 0 else "N/A"
-            
-            # Format participants
-            participants = recording['participants'] if recording['participants'] else []
-            participants_str = ", ".join(participants) if participants else "None"
-            
-            embed.add_field(
-                name=f"{status_emoji} Recording #{recording['id']}",
-                value=f"**Channel:** {recording['channel_name']}\n"
-                      f"**Started by:** {recording['started_by_name']}\n"
-                      f"**Duration:** {duration_str}\n"
-                      f"**Size:** {file_size_str}\n"
-                      f"**Participants:** {participants_str}\n"
-                      f"**Date:** {recording['start_time'][:10]}",
-                inline=False
-            )
-        
         # Add download instructions
         embed.add_field(
             name="📥 How to Download",
@@ -264,10 +323,7 @@ async def recordings_command(interaction: discord.Interaction, page: int = 1):
         
     except Exception as e:
         logger.error(f"Error listing recordings: {e}")
-        await interaction.followup.send(
-            "❌ Failed to list recordings. Please try again.",
-            ephemeral=True
-        )
+        await _send_error(interaction, "Failed to list recordings. Please try again.")
 
 @bot.tree.command(name="download", description="Get download link for a recording")
 async def download_command(interaction: discord.Interaction, recording_id: int):
@@ -276,38 +332,31 @@ async def download_command(interaction: discord.Interaction, recording_id: int):
     
     try:
         # Get recording from database
-        recording = await bot.db.get_recording(recording_id)
+        recording = bot.recording_cache.get(recording_id)
+        if recording is None:
+            recording = await bot.db.get_recording(recording_id)
+            # Completed rows never change, so they are safe to keep around
+            if recording and recording['status'] == 'completed':
+                bot.recording_cache[recording_id] = recording
         
         if not recording:
-            await interaction.followup.send(
-                "❌ Recording not found.",
-                ephemeral=True
-            )
+            await _send_error(interaction, "Recording not found.")
             return
         
         # Check if user can access this recording (same guild or started by them)
         if (recording['guild_id'] != interaction.guild.id and 
             recording['started_by'] != interaction.user.id):
-            await interaction.followup.send(
-                "❌ You don't have permission to download this recording.",
-                ephemeral=True
-            )
+            await _send_error(interaction, "You don't have permission to download this recording.")
             return
         
         # Check if recording is completed
         if recording['status'] != 'completed':
-            await interaction.followup.send(
-                "❌ Recording is not yet completed. Please wait for processing to finish.",
-                ephemeral=True
-            )
+            await _send_error(interaction, "Recording is not yet completed. Please wait for processing to finish.")
             return
         
         # Check if file exists
         if not recording['file_path'] or not os.path.exists(recording['file_path']):
-            await interaction.followup.send(
-                "❌ Recording file not found. It may have been deleted.",
-                ephemeral=True
-            )
+            await _send_error(interaction, "Recording file not found. It may have been deleted.")
             return
         
         # Generate download token
@@ -323,15 +372,14 @@ async def download_command(interaction: discord.Interaction, recording_id: int):
         await bot.db.create_download_token(token, recording_id, interaction.user.id, expires_at)
         
         # Generate download URL
-        config = get_config()
-        base_url = config.get_base_url()
+        base_url = bot.config.get_base_url()
         download_url = bot.file_server.get_download_url(token, base_url)
         
         # Create embed
         embed = discord.Embed(
             title="📥 Download Link",
             description=f"Download link for Recording #{recording_id}",
-            color=discord.Color.green()
+            color=_GREEN
         )
         
         embed.add_field(name="Download URL", value=download_url, inline=False)
@@ -345,23 +393,17 @@ async def download_command(interaction: discord.Interaction, recording_id: int):
         
     except Exception as e:
         logger.error(f"Error generating download link: {e}")
-        await interaction.followup.send(
-            "❌ Failed to generate download link. Please try again.",
-            ephemeral=True
-        )
+        await _send_error(interaction, "Failed to generate download link. Please try again.")
 
 async def recording_finished(sink, channel, recording_id):
     """Callback when recording is finished"""
     try:
         # Get user audio files
-        user_audio_files = sink.cleanup()
+        user_audio_files = await asyncio.to_thread(sink.cleanup)
         
         # Find the recording info
-        recording_info = None
-        for guild_id, info in bot.active_recordings.items():
-            if info['recording_id'] == recording_id:
-                recording_info = info
-                break
+        guild_id = bot.recording_id_to_guild.get(recording_id)
+        recording_info = bot.active_recordings.get(guild_id) if guild_id is not None else None
         
         if recording_info:
             recording_info['user_audio_files'] = user_audio_files
@@ -389,19 +431,16 @@ async def status_command(interaction: discord.Interaction):
     recording_id = recording_info['recording_id']
     
     # Calculate duration
-    duration = (datetime.utcnow() - recording_info['start_time']).total_seconds()
-    duration_str = f"{int(duration // 60)}:{int(duration % 60):02d}"
+    duration = int(time.monotonic() - recording_info['start_monotonic'])
+    duration_str = f"{duration // 60}:{duration % 60:02d}"
     
-    # Get current participants
-    voice_client = recording_info['voice_client']
-    current_participants = []
-    if voice_client and voice_client.channel:
-        current_participants = [member.display_name for member in voice_client.channel.members if not member.bot]
+    # Participants are kept current by the bot's voice state handler
+    current_participants = recording_info['participants']
     
     embed = discord.Embed(
         title="🎙️ Recording Status",
         description=f"Recording #{recording_id} is currently active",
-        color=discord.Color.green()
+        color=_GREEN
     )
     
     embed.add_field(name="Duration", value=duration_str, inline=True)
@@ -1,203 +1,294 @@
 import os
-import yaml
+import copy
+import atexit
+import socket
+import time
 import logging
-from typing import Dict, Any, Optional
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Any, Optional, Sequence, Tuple, Union
+from collections import OrderedDict
+from functools import lru_cache
 from pathlib import Path
 
-class Config:
-    """Application configuration loaded from YAML file"""
+logger = logging.getLogger(__name__)
+
+@lru_cache(maxsize=None)
+def _yaml_backend():
+    """Import PyYAML on first use and return (yaml, Loader, Dumper)
     
-    # Default configuration
-    _defaults = {
-        'discord': {
-            'token': None,
-            'activity': {
-                'type': 'listening',
-                'name': 'voice channels | /join to start recording'
-            }
-        },
-        'database': {
-            'path': './data/recordings.db',
-            'connection': {
-                'timeout': 30,
-                'check_same_thread': False
-            }
-        },
-        'storage': {
-            'recordings_path': './recordings',
-            'cleanup_after_hours': 24,
-            'organize_by_date': True,
-            'max_file_size_mb': 500
-        },
-        'audio': {
-            'quality': '192k',
-            'format': 'mp3',
-            'sample_rate': 48000,
-            'channels': 2,
-            'max_duration_seconds': 7200,
-            'silence_threshold': -40,
-            'normalize_audio': True,
-            'remove_silence': False,
-            'fade_in_seconds': 0.5,
-            'fade_out_seconds': 1.0
+    Deferred so processes that never parse or save a config file don't pay
+    the import. Prefers the libyaml-backed loader/dumper when available.
+    """
+    import yaml
+    try:
+        from yaml import CSafeLoader as loader, CSafeDumper as dumper
+    except ImportError:
+        from yaml import SafeLoader as loader, SafeDumper as dumper
+    return yaml, loader, dumper
+
+# Parsed YAML files keyed by (path, mtime_ns, size), most recently used last
+_yaml_cache: "OrderedDict[Tuple[str, int, int], Any]" = OrderedDict()
+_YAML_CACHE_SIZE = 8
+
+def _read_yaml_cached(config_file: Path) -> Any:
+    """Parse a YAML file, reusing the previous parse while the file is unchanged"""
+    st = os.stat(config_file)
+    key = (str(config_file.resolve()), st.st_mtime_ns, st.st_size)
+    
+    if key in _yaml_cache:
+        _yaml_cache.move_to_end(key)
+    else:
+        yaml, loader, _ = _yaml_backend()
+        with open(config_file, 'r') as f:
+            _yaml_cache[key] = yaml.load(f, Loader=loader)
+        if len(_yaml_cache) > _YAML_CACHE_SIZE:
+            _yaml_cache.popitem(last=False)
+    
+    # Callers merge into and mutate the result, so never hand out the cached object
+    return copy.deepcopy(_yaml_cache[key])
+
+# Last discovered local IP and the monotonic time it was resolved
+_local_ip_cache: Tuple[Optional[str], float] = (None, 0.0)
+
+def _get_local_ip(ttl: float = 60.0) -> Optional[str]:
+    """Get the outbound local IP address, cached for ttl seconds; None if unavailable"""
+    global _local_ip_cache
+    ip, resolved_at = _local_ip_cache
+    if ip and time.monotonic() - resolved_at < ttl:
+        return ip
+    
+    try:
+        # Connecting a UDP socket sends nothing but selects the outbound interface
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.connect(('8.8.8.8', 80))
+            ip = s.getsockname()[0]
+    except OSError:
+        return None
+    
+    _local_ip_cache = (ip, time.monotonic())
+    return ip
+
+def _safe_int(value: str) -> Any:
+    """Convert an environment value to int, leaving it unchanged if it isn't one"""
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+# Environment variable -> (pre-split config path, type conversion)
+_ENV_OVERRIDES = tuple(
+    (env_var, tuple(path.split('.')), cast)
+    for env_var, path, cast in (
+        ('DISCORD_TOKEN', 'discord.token', str),
+        ('DATABASE_PATH', 'database.path', str),
+        ('RECORDINGS_PATH', 'storage.recordings_path', str),
+        ('WEB_SERVER_HOST', 'web_server.host', str),
+        ('WEB_SERVER_PORT', 'web_server.port', _safe_int),
+        ('AUDIO_QUALITY', 'audio.quality', str),
+        ('AUDIO_FORMAT', 'audio.format', str),
+        ('MAX_RECORDING_DURATION', 'audio.max_duration_seconds', _safe_int),
+        ('CLEANUP_AFTER_HOURS', 'storage.cleanup_after_hours', _safe_int),
+        ('LOG_LEVEL', 'logging.level', str),
+    )
+)
+
+def _flatten(config: Dict[str, Any], prefix: str = ''):
+    """Yield (dotted_path, value) for every section and leaf of a nested config"""
+    for key, value in config.items():
+        path = f"{prefix}{key}"
+        yield path, value
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{path}.")
+
+# Default configuration; only ever deep-copied, never mutated
+_DEFAULTS = {
+    'discord': {
+        'token': None,
+        'activity': {
+            'type': 'listening',
+            'name': 'voice channels | /join to start recording'
+        }
+    },
+    'database': {
+        'path': './data/recordings.db',
+        'connection': {
+            'timeout': 30,
+            'check_same_thread': False
+        }
+    },
+    'storage': {
+        'recordings_path': './recordings',
+        'cleanup_after_hours': 24,
+        'organize_by_date': True,
+        'max_file_size_mb': 500
+    },
+    'audio': {
+        'quality': '192k',
+        'format': 'mp3',
+        'sample_rate': 48000,
+        'channels': 2,
+        'max_duration_seconds': 7200,
+        'silence_threshold': -40,
+        'normalize_audio': True,
+        'remove_silence': False,
+        'fade_in_seconds': 0.5,
+        'fade_out_seconds': 1.0
+    },
+    'web_server': {
+        'host': '0.0.0.0',
+        'port': 8000,
+        'download_token_expires_hours': 1,
+        'max_concurrent_downloads': 10,
+        'ssl': {
+            'enabled': False,
+            'cert_file': '',
+            'key_file': ''
+        }
+    },
+    'logging': {
+        'level': 'INFO',
+        'file': {
+            'enabled': True,
+            'path': './logs/bot.log',
+            'max_size_mb': 10,
+            'backup_count': 5
         },
-        'web_server': {
-            'host': '0.0.0.0',
-            'port': 8000,
-            'download_token_expires_hours': 1,
-            'max_concurrent_downloads': 10,
-            'ssl': {
-                'enabled': False,
-                'cert_file': '',
-                'key_file': ''
-            }
+        'error_file': {
+            'enabled': True,
+            'path': './logs/errors.log'
         },
-        'logging': {
-            'level': 'INFO',
-            'file': {
-                'enabled': True,
-                'path': './logs/bot.log',
-                'max_size_mb': 10,
-                'backup_count': 5
-            },
-            'error_file': {
-                'enabled': True,
-                'path': './logs/errors.log'
-            },
-            'console': {
-                'enabled': True,
-                'format': 'simple'
-            },
-            'discord_log_level': 'WARNING'
+        'console': {
+            'enabled': True,
+            'format': 'simple'
         },
-        'features': {
-            'slash_commands': True,
-            'voice_recording': True,
-            'file_serving': True,
-            'auto_cleanup': True,
-            'experimental': {
-                'voice_activity_detection': False,
-                'real_time_transcription': False,
-                'multi_channel_recording': False
-            }
+        'discord_log_level': 'WARNING'
+    },
+    'features': {
+        'slash_commands': True,
+        'voice_recording': True,
+        'file_serving': True,
+        'auto_cleanup': True,
+        'experimental': {
+            'voice_activity_detection': False,
+            'real_time_transcription': False,
+            'multi_channel_recording': False
+        }
+    },
+    'permissions': {
+        'recording': {
+            'required_permissions': ['connect', 'speak'],
+            'allowed_roles': [],
+            'blocked_users': []
         },
-        'permissions': {
-            'recording': {
-                'required_permissions': ['connect', 'speak'],
-                'allowed_roles': [],
-                'blocked_users': []
-            },
-            'download': {
-                'creator_only': False,
-                'same_guild_only': True,
-                'max_downloads_per_user': 10
-            },
-            'admin': {
-                'required_permissions': ['manage_messages'],
-                'allowed_users': []
-            }
+        'download': {
+            'creator_only': False,
+            'same_guild_only': True,
+            'max_downloads_per_user': 10
         },
-        'notifications': {
-            'recording_started': True,
-            'recording_stopped': True,
-            'processing_complete': True,
-            'errors': True,
-            'channels': {
-                'log_channel': None,
-                'error_channel': None
-            },
-            'mentions': {
-                'recording_creator': True,
-                'participants': False
-            }
+        'admin': {
+            'required_permissions': ['manage_messages'],
+            'allowed_users': []
+        }
+    },
+    'notifications': {
+        'recording_started': True,
+        'recording_stopped': True,
+        'processing_complete': True,
+        'errors': True,
+        'channels': {
+            'log_channel': None,
+            'error_channel': None
         },
-        'advanced': {
-            'max_concurrent_recordings': 5,
-            'audio_buffer_size': 4096,
-            'processing_threads': 2,
-            'max_retries': 3,
-            'retry_delay_seconds': 5,
-            'max_memory_usage_mb': 1024,
-            'garbage_collection_interval': 300,
-            'debug_mode': False,
-            'profiling_enabled': False
+        'mentions': {
+            'recording_creator': True,
+            'participants': False
         }
+    },
+    'advanced': {
+        'max_concurrent_recordings': 5,
+        'audio_buffer_size': 4096,
+        'processing_threads': 2,
+        'max_retries': 3,
+        'retry_delay_seconds': 5,
+        'max_memory_usage_mb': 1024,
+        'garbage_collection_interval': 300,
+        'debug_mode': False,
+        'profiling_enabled': False
     }
+}
+
+class Config:
+    """Application configuration loaded from YAML file"""
+    
+    # Legacy attribute name -> configuration path
+    _LEGACY_MAP = (
+        ('DISCORD_TOKEN', 'discord.token'),
+        ('DATABASE_PATH', 'database.path'),
+        ('RECORDINGS_PATH', 'storage.recordings_path'),
+        ('WEB_SERVER_HOST', 'web_server.host'),
+        ('WEB_SERVER_PORT', 'web_server.port'),
+        ('AUDIO_QUALITY', 'audio.quality'),
+        ('AUDIO_FORMAT', 'audio.format'),
+        ('MAX_RECORDING_DURATION', 'audio.max_duration_seconds'),
+        ('CLEANUP_AFTER_HOURS', 'storage.cleanup_after_hours'),
+        ('LOG_LEVEL', 'logging.level'),
+    )
     
     def __init__(self, config_path: str = 'config.yaml'):
         """Initialize configuration from YAML file"""
         self.config_path = config_path
         self._config = self._load_config()
+        self._flat = dict(_flatten(self._config))
+        self._validated = False
+        self._base_url = None
         
         # Legacy compatibility properties
-        self.DISCORD_TOKEN = self.get('discord.token')
-        self.DATABASE_PATH = self.get('database.path')
-        self.RECORDINGS_PATH = self.get('storage.recordings_path')
-        self.WEB_SERVER_HOST = self.get('web_server.host')
-        self.WEB_SERVER_PORT = self.get('web_server.port')
-        self.AUDIO_QUALITY = self.get('audio.quality')
-        self.AUDIO_FORMAT = self.get('audio.format')
-        self.MAX_RECORDING_DURATION = self.get('audio.max_duration_seconds')
-        self.CLEANUP_AFTER_HOURS = self.get('storage.cleanup_after_hours')
-        self.LOG_LEVEL = self.get('logging.level')
+        for attr, path in self._LEGACY_MAP:
+            setattr(self, attr, self._flat.get(path))
     
     def _load_config(self) -> Dict[str, Any]:
         """Load configuration from YAML file"""
-        config = self._defaults.copy()
+        config = copy.deepcopy(_DEFAULTS)
         
         # Try to load from YAML file
         config_file = Path(self.config_path)
         if config_file.exists():
             try:
-                with open(config_file, 'r') as f:
-                    file_config = yaml.safe_load(f)
-                    if file_config:
-                        config = self._merge_configs(config, file_config)
+                file_config = _read_yaml_cached(config_file)
+                if file_config:
+                    self._merge_configs(config, file_config)
             except Exception as e:
                 raise ValueError(f"Failed to load config from {self.config_path}: {e}")
         
         # Override with environment variables if they exist (for Docker compatibility)
-        env_overrides = {
-            'DISCORD_TOKEN': 'discord.token',
-            'DATABASE_PATH': 'database.path',
-            'RECORDINGS_PATH': 'storage.recordings_path',
-            'WEB_SERVER_HOST': 'web_server.host',
-            'WEB_SERVER_PORT': 'web_server.port',
-            'AUDIO_QUALITY': 'audio.quality',
-            'AUDIO_FORMAT': 'audio.format',
-            'MAX_RECORDING_DURATION': 'audio.max_duration_seconds',
-            'CLEANUP_AFTER_HOURS': 'storage.cleanup_after_hours',
-            'LOG_LEVEL': 'logging.level'
-        }
-        
-        for env_var, config_path in env_overrides.items():
-            env_value = os.getenv(env_var)
+        for env_var, keys, cast in _ENV_OVERRIDES:
+            env_value = os.environ.get(env_var)
             if env_value is not None:
-                # Convert string values to appropriate types
-                if env_var in ['WEB_SERVER_PORT', 'MAX_RECORDING_DURATION', 'CLEANUP_AFTER_HOURS']:
-                    try:
-                        env_value = int(env_value)
-                    except ValueError:
-                        pass
-                self._set_nested_value(config, config_path, env_value)
+                self._set_nested_value(config, keys, cast(env_value))
         
         return config
     
     def _merge_configs(self, base: Dict[str, Any], override: Dict[str, Any]) -> Dict[str, Any]:
-        """Recursively merge configuration dictionaries"""
-        result = base.copy()
+        """Merge override into base in place, with override winning on conflicts
         
-        for key, value in override.items():
-            if key in result and isinstance(result[key], dict) and isinstance(value, dict):
-                result[key] = self._merge_configs(result[key], value)
-            else:
-                result[key] = value
+        base must be a private copy (as in _load_config); it is returned for convenience.
+        """
+        # Walk matching sub-dicts with an explicit stack
+        stack = [(base, override)]
+        while stack:
+            dst, src = stack.pop()
+            for key, value in src.items():
+                if isinstance(value, dict) and isinstance(dst.get(key), dict):
+                    stack.append((dst[key], value))
+                else:
+                    dst[key] = value
         
-        return result
+        return base
     
-    def _set_nested_value(self, config: Dict[str, Any], path: str, value: Any):
-        """Set a nested configuration value using dot notation"""
-        keys = path.split('.')
+    def _set_nested_value(self, config: Dict[str, Any], path: Union[str, Sequence[str]], value: Any):
+        """Set a nested configuration value using dot notation or pre-split keys"""
+        keys = path.split('.') if isinstance(path, str) else path
         current = config
         
         for key in keys[:-1]:
@@ -209,19 +300,15 @@ class Config:
     
     def get(self, path: str, default: Any = None) -> Any:
         """Get a configuration value using dot notation"""
-        keys = path.split('.')
-        current = self._config
-        
-        try:
-            for key in keys:
-                current = current[key]
-            return current
-        except (KeyError, TypeError):
-            return default
+        return self._flat.get(path, default)
     
     def set(self, path: str, value: Any):
         """Set a configuration value using dot notation"""
         self._set_nested_value(self._config, path, value)
+        # The value may replace a whole subtree, so rebuild the flat view
+        self._flat = dict(_flatten(self._config))
+        self._validated = False
+        self._base_url = None
     
     def get_section(self, section: str) -> Dict[str, Any]:
         """Get an entire configuration section"""
@@ -230,19 +317,30 @@ class Config:
     def reload(self):
         """Reload configuration from file"""
         self._config = self._load_config()
+        self._flat = dict(_flatten(self._config))
+        self._validated = False
+        self._base_url = None
     
     def save(self, path: Optional[str] = None):
         """Save current configuration to YAML file"""
         save_path = path or self.config_path
+        yaml, _, dumper = _yaml_backend()
         with open(save_path, 'w') as f:
-            yaml.dump(self._config, f, default_flow_style=False, indent=2)
+            yaml.dump(self._config, f, Dumper=dumper, default_flow_style=False, indent=2)
     
     def to_dict(self) -> Dict[str, Any]:
         """Get the full configuration as a dictionary"""
         return self._config.copy()
     
     def validate(self):
-        """Validate configuration"""
+        """Validate configuration
+        
+        The result is remembered until the configuration changes, so repeated
+        calls skip the directory creation and write-permission probes.
+        """
+        if self._validated:
+            return True
+        
         errors = []
         warnings = []
         
@@ -278,13 +376,8 @@ class Config:
         # Test write permissions
         test_dirs = [(recordings_path, "recordings"), (db_dir, "database") if db_dir else None]
         for dir_path, name in filter(None, test_dirs):
-            try:
-                test_file = os.path.join(dir_path, '.write_test')
-                with open(test_file, 'w') as f:
-                    f.write('test')
-                os.remove(test_file)
-            except Exception as e:
-                errors.append(f"No write permission for {name} directory '{dir_path}': {e}")
+            if not os.access(dir_path, os.W_OK | os.X_OK):
+                errors.append(f"No write permission for {name} directory '{dir_path}'")
         
         # Audio format validation
         audio_format = self.get('audio.format')
@@ -313,8 +406,6 @@ class Config:
         
         # Report warnings
         if warnings:
-            import logging
-            logger = logging.getLogger(__name__)
             for warning in warnings:
                 logger.warning(f"Configuration warning: {warning}")
         
@@ -322,37 +413,51 @@ class Config:
         if errors:
             raise ValueError("Configuration errors: " + "; ".join(errors))
         
+        self._validated = True
         return True
     
     def get_base_url(self) -> str:
-        """Get the base URL for the web server, using IP if no domain is configured"""
+        """Get the base URL for the web server, using IP if no domain is configured
+        
+        The result is cached until the configuration is changed or reloaded,
+        except when it depends on the probed local IP, which has its own TTL.
+        """
+        if self._base_url is not None:
+            return self._base_url
+        
+        base_url, cacheable = self._compute_base_url()
+        if cacheable:
+            self._base_url = base_url
+        return base_url
+    
+    def _compute_base_url(self) -> Tuple[str, bool]:
+        """Build the base URL and whether it can be cached
+        
+        URLs for a wildcard bind use the local IP probe, so they are not
+        cached here and follow _get_local_ip's refresh and failure handling.
+        """
+        flat = self._flat
+        domain = flat.get('web_server.domain')
+        ssl = flat.get('web_server.ssl.enabled', False)
+        scheme = 'https' if ssl else 'http'
+        
         # Check if a domain is configured
-        domain = self.get('web_server.domain')
         if domain:
-            protocol = 'https' if self.get('web_server.ssl.enabled') else 'http'
-            return f"{protocol}://{domain}"
+            return f"{scheme}://{domain}", True
         
         # Fall back to IP address
-        host = self.get('web_server.host')
-        port = self.get('web_server.port')
+        host = flat.get('web_server.host')
+        port = flat.get('web_server.port')
         
         # If host is 0.0.0.0, try to get the actual IP
-        if host == '0.0.0.0':
-            try:
-                import socket
-                # Get local IP address
-                with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
-                    s.connect(('8.8.8.8', 80))
-                    host = s.getsockname()[0]
-            except:
-                host = 'localhost'
+        cacheable = host != '0.0.0.0'
+        if not cacheable:
+            host = _get_local_ip() or 'localhost'
         
         # Standard ports don't need to be shown
-        if (port == 80 and not self.get('web_server.ssl.enabled')) or \
-           (port == 443 and self.get('web_server.ssl.enabled')):
-            return f"http{'s' if self.get('web_server.ssl.enabled') else ''}://{host}"
-        else:
-            return f"http{'s' if self.get('web_server.ssl.enabled') else ''}://{host}:{port}"
+        if port == (443 if ssl else 80):
+            return f"{scheme}://{host}", cacheable
+        return f"{scheme}://{host}:{port}", cacheable
 
 # Global configuration instance
 _config_instance = None
@@ -367,6 +472,13 @@ def get_config() -> Config:
 # For backwards compatibility, create a default instance
 Config = get_config()
 
+# Third-party loggers whose levels are managed by setup_logging
+_DISCORD_LOGGERS = ('discord', 'discord.gateway', 'discord.client', 'discord.voice_client')
+_UVICORN_LOGGERS = ('uvicorn', 'uvicorn.access')
+
+# Background listener draining the logging queue, started by setup_logging
+_log_listener = None
+
 def setup_logging(config: Config = None):
     """Setup logging configuration from YAML config"""
     if config is None:
@@ -412,27 +524,48 @@ def setup_logging(config: Config = None):
         error_handler.setLevel(logging.ERROR)
         handlers.append(error_handler)
     
-    # Setup root logger
+    # Replace any listener from a previous setup so records aren't handled twice
+    stop_logging()
+    
+    # Setup root logger: callers only enqueue records, a background listener
+    # thread does the actual console/file I/O
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    # Leave formatting to the real handlers; only merge args into the message here
+    queue_handler.setFormatter(logging.Formatter('%(message)s'))
     logging.basicConfig(
         level=getattr(logging, logging_config['level'].upper()),
-        handlers=handlers,
+        handlers=[queue_handler],
         force=True  # Override any existing configuration
     )
     
+    global _log_listener
+    _log_listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _log_listener.start()
+    
+    # The listener thread is a daemon; drain it at exit so records logged just
+    # before exit(), e.g. startup failures, still reach the handlers
+    atexit.unregister(stop_logging)
+    atexit.register(stop_logging)
+    
     # Set discord.py logging level
     discord_log_level = getattr(logging, logging_config['discord_log_level'].upper())
-    logging.getLogger('discord').setLevel(discord_log_level)
-    logging.getLogger('discord.gateway').setLevel(discord_log_level)
-    logging.getLogger('discord.client').setLevel(discord_log_level)
-    logging.getLogger('discord.voice_client').setLevel(discord_log_level)
+    for name in _DISCORD_LOGGERS:
+        logging.getLogger(name).setLevel(discord_log_level)
     
     # Set uvicorn logging level
-    logging.getLogger('uvicorn').setLevel(logging.WARNING)
-    logging.getLogger('uvicorn.access').setLevel(logging.WARNING)
+    for name in _UVICORN_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
     
     # Log startup message
-    logger = logging.getLogger(__name__)
     logger.info(f"Logging system initialized - Level: {logging_config['level']}")
     logger.info(f"Log file: {logging_config['file']['path']}")
     if logging_config['error_file']['enabled']:
-        logger.info(f"Error log file: {logging_config['error_file']['path']}")
\ No newline at end of file
+        logger.info(f"Error log file: {logging_config['error_file']['path']}")
+
+def stop_logging():
+    """Flush queued log records and stop the background logging listener"""
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
\ No newline at end of file
@@ -1,5 +1,7 @@
 import aiosqlite
+import asyncio
 import os
+import json
 from datetime import datetime
 from typing import List, Optional, Dict, Any
 import logging
@@ -7,9 +9,135 @@ import logging
 logger = logging.getLogger(__name__)
 
 class DatabaseManager:
+    # Connection settings: WAL lets readers and the writer proceed concurrently,
+    # and synchronous=NORMAL avoids an fsync on every commit
+    _SQL_PRAGMAS = '''
+        PRAGMA foreign_keys = ON;
+        PRAGMA journal_mode = WAL;
+        PRAGMA synchronous = NORMAL;
+        PRAGMA temp_store = MEMORY;
+        PRAGMA mmap_size = 268435456;
+        PRAGMA cache_size = -64000;
+        PRAGMA busy_timeout = 5000;
+    '''
+    
+    # Tables plus the indexes for the guild listing, active-recording lookup
+    # and token expiry sweep, applied in a single executescript call
+    _SQL_SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS recordings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            channel_name TEXT NOT NULL,
+            started_by INTEGER NOT NULL,
+            started_by_name TEXT NOT NULL,
+            start_time TIMESTAMP NOT NULL,
+            end_time TIMESTAMP,
+            duration INTEGER,
+            file_path TEXT,
+            file_size INTEGER,
+            participants TEXT,
+            status TEXT DEFAULT 'recording',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        
+        CREATE TABLE IF NOT EXISTS download_tokens (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            token TEXT UNIQUE NOT NULL,
+            recording_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            expires_at TIMESTAMP NOT NULL,
+            used_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (recording_id) REFERENCES recordings (id)
+        );
+        
+        CREATE INDEX IF NOT EXISTS idx_recordings_guild_start
+        ON recordings (guild_id, start_time DESC);
+        
+        CREATE INDEX IF NOT EXISTS idx_recordings_guild_active
+        ON recordings (guild_id, start_time DESC) WHERE status = 'recording';
+        
+        CREATE INDEX IF NOT EXISTS idx_tokens_expires
+        ON download_tokens (expires_at);
+    '''
+    
+    # Query text shared by every call, defined once at class level
+    _RECORDING_COLUMNS = '''
+        id, guild_id, channel_id, channel_name, started_by, started_by_name,
+        start_time, end_time, duration, file_path, file_size, participants, status
+    '''
+    
+    _SQL_START_RECORDING = '''
+        INSERT INTO recordings (guild_id, channel_id, channel_name, started_by, 
+                              started_by_name, start_time, status)
+        VALUES (?, ?, ?, ?, ?, ?, 'recording')
+        RETURNING id
+    '''
+    
+    _SQL_FINISH_RECORDING = '''
+        UPDATE recordings 
+        SET end_time = ?, file_path = ?, file_size = ?, participants = ?, 
+            duration = ?, status = 'completed', updated_at = ?
+        WHERE id = ?
+    '''
+    
+    _SQL_GET_RECORDING = f'''
+        SELECT {_RECORDING_COLUMNS}
+        FROM recordings WHERE id = ?
+    '''
+    
+    _SQL_GUILD_RECORDINGS = f'''
+        SELECT {_RECORDING_COLUMNS}
+        FROM recordings 
+        WHERE guild_id = ? 
+        ORDER BY start_time DESC 
+        LIMIT ? OFFSET ?
+    '''
+    
+    _SQL_ACTIVE_RECORDING = f'''
+        SELECT {_RECORDING_COLUMNS}
+        FROM recordings 
+        WHERE guild_id = ? AND status = 'recording'
+        ORDER BY start_time DESC 
+        LIMIT 1
+    '''
+    
+    _SQL_CREATE_TOKEN = '''
+        INSERT INTO download_tokens (token, recording_id, user_id, expires_at)
+        VALUES (?, ?, ?, ?)
+    '''
+    
+    _SQL_GET_TOKEN = '''
+        SELECT dt.token, dt.recording_id, dt.user_id, dt.expires_at, dt.used_at,
+               r.file_path, r.guild_id, r.started_by
+        FROM download_tokens dt
+        JOIN recordings r ON dt.recording_id = r.id
+        WHERE dt.token = ?
+    '''
+    
+    _SQL_MARK_TOKEN_USED = '''
+        UPDATE download_tokens 
+        SET used_at = ? 
+        WHERE token = ?
+    '''
+    
+    _SQL_CLEANUP_TOKENS = '''
+        DELETE FROM download_tokens 
+        WHERE expires_at < ?
+    '''
+    
+    # Most token writes coalesced into a single commit
+    _WRITE_BATCH_SIZE = 32
+    
     def __init__(self, db_path: str):
         self.db_path = db_path
         self.connection = None
+        
+        # Batched writer for high-frequency token statements
+        self._write_queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
     
     async def initialize(self):
         """Initialize database connection and create tables"""
@@ -30,13 +158,18 @@ class DatabaseManager:
             
             # Connect to database
             self.connection = await aiosqlite.connect(self.db_path)
-            await self.connection.execute('PRAGMA foreign_keys = ON')
+            self.connection.row_factory = aiosqlite.Row
+            await self.connection.executescript(self._SQL_PRAGMAS)
             
             # Test database connection
             await self.connection.execute('SELECT 1')
             
             # Create tables
             await self.create_tables()
+            
+            # Start the batched writer; every write after schema setup goes through it
+            self._write_queue = asyncio.Queue()
+            self._writer_task = asyncio.create_task(self._write_loop())
             logger.info(f"Database initialized at {self.db_path}")
             
         except Exception as e:
@@ -48,46 +181,22 @@ class DatabaseManager:
     
     async def create_tables(self):
         """Create database tables"""
-        async with self.connection.execute('''
-            CREATE TABLE IF NOT EXISTS recordings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                guild_id INTEGER NOT NULL,
-                channel_id INTEGER NOT NULL,
-                channel_name TEXT NOT NULL,
-                started_by INTEGER NOT NULL,
-                started_by_name TEXT NOT NULL,
-                start_time TIMESTAMP NOT NULL,
-                end_time TIMESTAMP,
-                duration INTEGER,
-                file_path TEXT,
-                file_size INTEGER,
-                participants TEXT,
-                status TEXT DEFAULT 'recording',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        '''):
-            pass
-        
-        async with self.connection.execute('''
-            CREATE TABLE IF NOT EXISTS download_tokens (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                token TEXT UNIQUE NOT NULL,
-                recording_id INTEGER NOT NULL,
-                user_id INTEGER NOT NULL,
-                expires_at TIMESTAMP NOT NULL,
-                used_at TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (recording_id) REFERENCES recordings (id)
-            )
-        '''):
-            pass
-        
+        await self.connection.executescript(self._SQL_SCHEMA)
         await self.connection.commit()
         logger.info("Database tables created successfully")
     
     async def close(self):
         """Close database connection"""
+        if self._writer_task:
+            await self.flush()
+            self._writer_task.cancel()
+            # Let the cancellation land before the connection goes away
+            try:
+                await self._writer_task
+            except asyncio.CancelledError:
+                pass
+            self._writer_task = None
+        
         if self.connection:
             await self.connection.close()
             logger.info("Database connection closed")
@@ -95,19 +204,11 @@ class DatabaseManager:
     async def start_recording(self, guild_id: int, channel_id: int, channel_name: str, 
                             started_by: int, started_by_name: str) -> int:
         """Start a new recording and return its ID"""
-        async with self.connection.execute('''
-            INSERT INTO recordings (guild_id, channel_id, channel_name, started_by, 
-                                  started_by_name, start_time, status)
-            VALUES (?, ?, ?, ?, ?, ?, 'recording')
-        ''', (guild_id, channel_id, channel_name, started_by, started_by_name, datetime.utcnow())):
-            pass
-        
-        await self.connection.commit()
-        
-        # Get the recording ID
-        async with self.connection.execute('SELECT last_insert_rowid()') as cursor:
-            result = await cursor.fetchone()
-            recording_id = result[0]
+        (recording_id,) = await self._queue_write(
+            self._SQL_START_RECORDING,
+            (guild_id, channel_id, channel_name, started_by, started_by_name, datetime.utcnow()),
+            fetch=True
+        )
         
         logger.info(f"Started recording {recording_id} in guild {guild_id}, channel {channel_id}")
         return recording_id
@@ -115,156 +216,115 @@ class DatabaseManager:
     async def finish_recording(self, recording_id: int, file_path: str, file_size: int, 
                              participants: List[str], duration: int):
         """Mark recording as finished and update metadata"""
-        await self.connection.execute('''
-            UPDATE recordings 
-            SET end_time = ?, file_path = ?, file_size = ?, participants = ?, 
-                duration = ?, status = 'completed', updated_at = ?
-            WHERE id = ?
-        ''', (datetime.utcnow(), file_path, file_size, ','.join(participants), 
-              duration, datetime.utcnow(), recording_id))
-        
-        await self.connection.commit()
+        # One timestamp for both columns so end_time always equals updated_at
+        now = datetime.utcnow()
+        participants_json = json.dumps(participants, separators=(',', ':'))
+        await self._queue_write(
+            self._SQL_FINISH_RECORDING,
+            (now, file_path, file_size, participants_json, duration, now, recording_id)
+        )
         logger.info(f"Recording {recording_id} finished successfully")
     
+    @staticmethod
+    def _recording_from_row(row: aiosqlite.Row) -> Dict[str, Any]:
+        """Convert a recordings row into the dict shape callers expect"""
+        recording = dict(row)
+        participants = recording['participants']
+        if not participants:
+            recording['participants'] = []
+        elif participants.startswith('['):
+            recording['participants'] = json.loads(participants)
+        else:
+            # Rows written before participants were stored as JSON
+            recording['participants'] = participants.split(',')
+        return recording
+    
     async def get_recording(self, recording_id: int) -> Optional[Dict[str, Any]]:
         """Get recording by ID"""
-        async with self.connection.execute('''
-            SELECT id, guild_id, channel_id, channel_name, started_by, started_by_name,
-                   start_time, end_time, duration, file_path, file_size, participants, status
-            FROM recordings WHERE id = ?
-        ''', (recording_id,)) as cursor:
+        async with self.connection.execute(self._SQL_GET_RECORDING, (recording_id,)) as cursor:
             row = await cursor.fetchone()
             
-            if row:
-                return {
-                    'id': row[0],
-                    'guild_id': row[1],
-                    'channel_id': row[2],
-                    'channel_name': row[3],
-                    'started_by': row[4],
-                    'started_by_name': row[5],
-                    'start_time': row[6],
-                    'end_time': row[7],
-                    'duration': row[8],
-                    'file_path': row[9],
-                    'file_size': row[10],
-                    'participants': row[11].split(',') if row[11] else [],
-                    'status': row[12]
-                }
-            return None
+            return self._recording_from_row(row) if row else None
     
     async def get_guild_recordings(self, guild_id: int, limit: int = 10, offset: int = 0) -> List[Dict[str, Any]]:
         """Get recordings for a guild with pagination"""
-        async with self.connection.execute('''
-            SELECT id, guild_id, channel_id, channel_name, started_by, started_by_name,
-                   start_time, end_time, duration, file_path, file_size, participants, status
-            FROM recordings 
-            WHERE guild_id = ? 
-            ORDER BY start_time DESC 
-            LIMIT ? OFFSET ?
-        ''', (guild_id, limit, offset)) as cursor:
+        async with self.connection.execute(self._SQL_GUILD_RECORDINGS, (guild_id, limit, offset)) as cursor:
             rows = await cursor.fetchall()
             
-            recordings = []
-            for row in rows:
-                recordings.append({
-                    'id': row[0],
-                    'guild_id': row[1],
-                    'channel_id': row[2],
-                    'channel_name': row[3],
-                    'started_by': row[4],
-                    'started_by_name': row[5],
-                    'start_time': row[6],
-                    'end_time': row[7],
-                    'duration': row[8],
-                    'file_path': row[9],
-                    'file_size': row[10],
-                    'participants': row[11].split(',') if row[11] else [],
-                    'status': row[12]
-                })
-            
-            return recordings
+            return [self._recording_from_row(row) for row in rows]
     
     async def get_active_recording(self, guild_id: int) -> Optional[Dict[str, Any]]:
         """Get active recording for a guild"""
-        async with self.connection.execute('''
-            SELECT id, guild_id, channel_id, channel_name, started_by, started_by_name,
-                   start_time, end_time, duration, file_path, file_size, participants, status
-            FROM recordings 
-            WHERE guild_id = ? AND status = 'recording'
-            ORDER BY start_time DESC 
-            LIMIT 1
-        ''', (guild_id,)) as cursor:
+        async with self.connection.execute(self._SQL_ACTIVE_RECORDING, (guild_id,)) as cursor:
             row = await cursor.fetchone()
             
-            if row:
-                return {
-                    'id': row[0],
-                    'guild_id': row[1],
-                    'channel_id': row[2],
-                    'channel_name': row[3],
-                    'started_by': row[4],
-                    'started_by_name': row[5],
-                    'start_time': row[6],
-                    'end_time': row[7],
-                    'duration': row[8],
-                    'file_path': row[9],
-                    'file_size': row[10],
-                    'participants': row[11].split(',') if row[11] else [],
-                    'status': row[12]
-                }
-            return None
+            return self._recording_from_row(row) if row else None
     
     async def create_download_token(self, token: str, recording_id: int, user_id: int, expires_at: datetime):
         """Create a download token"""
-        await self.connection.execute('''
-            INSERT INTO download_tokens (token, recording_id, user_id, expires_at)
-            VALUES (?, ?, ?, ?)
-        ''', (token, recording_id, user_id, expires_at))
-        
-        await self.connection.commit()
+        await self._queue_write(self._SQL_CREATE_TOKEN, (token, recording_id, user_id, expires_at))
         logger.info(f"Created download token for recording {recording_id}, user {user_id}")
     
     async def get_download_token(self, token: str) -> Optional[Dict[str, Any]]:
         """Get download token information"""
-        async with self.connection.execute('''
-            SELECT dt.token, dt.recording_id, dt.user_id, dt.expires_at, dt.used_at,
-                   r.file_path, r.guild_id, r.started_by
-            FROM download_tokens dt
-            JOIN recordings r ON dt.recording_id = r.id
-            WHERE dt.token = ?
-        ''', (token,)) as cursor:
+        async with self.connection.execute(self._SQL_GET_TOKEN, (token,)) as cursor:
             row = await cursor.fetchone()
             
-            if row:
-                return {
-                    'token': row[0],
-                    'recording_id': row[1],
-                    'user_id': row[2],
-                    'expires_at': row[3],
-                    'used_at': row[4],
-                    'file_path': row[5],
-                    'guild_id': row[6],
-                    'started_by': row[7]
-                }
-            return None
+            return dict(row) if row else None
     
     async def mark_token_used(self, token: str):
         """Mark a download token as used"""
-        await self.connection.execute('''
-            UPDATE download_tokens 
-            SET used_at = ? 
-            WHERE token = ?
-        ''', (datetime.utcnow(), token))
-        
-        await self.connection.commit()
+        await self._queue_write(self._SQL_MARK_TOKEN_USED, (datetime.utcnow(), token))
     
     async def cleanup_expired_tokens(self):
         """Remove expired download tokens"""
-        await self.connection.execute('''
-            DELETE FROM download_tokens 
-            WHERE expires_at < ?
-        ''', (datetime.utcnow(),))
+        await self._queue_write(self._SQL_CLEANUP_TOKENS, (datetime.utcnow(),))
+        logger.info("Expired download tokens cleaned up")
+    
+    async def flush(self):
+        """Wait until every queued write has been committed"""
+        await self._queue_write(None, ())
+    
+    async def _queue_write(self, sql: Optional[str], params: tuple, fetch: bool = False) -> Optional[aiosqlite.Row]:
+        """Queue a write for the batched writer and wait for its commit
         
-        await self.connection.commit()
-        logger.info("Expired download tokens cleaned up")
\ No newline at end of file
+        All writes go through here so that nothing else commits on the
+        connection in the middle of a batch. With fetch=True the statement's
+        first result row (e.g. from RETURNING) is returned.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._write_queue.put((sql, params, fetch, future))
+        return await future
+    
+    async def _write_loop(self):
+        """Execute queued writes in batches, committing once per batch"""
+        while True:
+            batch = [await self._write_queue.get()]
+            while len(batch) < self._WRITE_BATCH_SIZE and not self._write_queue.empty():
+                batch.append(self._write_queue.get_nowait())
+            
+            results = []
+            for sql, params, fetch, future in batch:
+                try:
+                    row = None
+                    if sql is not None:
+                        async with self.connection.execute(sql, params) as cursor:
+                            if fetch:
+                                row = await cursor.fetchone()
+                    results.append((future, row, None))
+                except Exception as e:
+                    results.append((future, None, e))
+            
+            try:
+                await self.connection.commit()
+            except Exception as e:
+                logger.error(f"Batched database commit failed: {e}")
+                results = [(future, None, e) for future, _, _ in results]
+            
+            for future, row, error in results:
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(row)
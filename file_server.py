@@ -1,27 +1,89 @@
 import asyncio
 import os
+import json
+import stat
+import time
 import logging
 from datetime import datetime, timedelta
-from typing import Optional, Dict
+from typing import Optional, Dict, Tuple
 import secrets
+import hashlib
 from pathlib import Path
 
+from cachetools import TLRUCache
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response
+from starlette.convertors import Convertor, register_url_convertor
 import uvicorn
 
 logger = logging.getLogger(__name__)
 
+# Content type for each recording file extension
+MEDIA_TYPES = {
+    '.mp3': 'audio/mpeg',
+    '.wav': 'audio/wav',
+    '.ogg': 'audio/ogg',
+    '.opus': 'audio/opus',
+    '.m4a': 'audio/mp4',
+    '.flac': 'audio/flac',
+}
+
+# Error bodies are constant, so they are serialized once
+_NOT_FOUND_BODY = json.dumps({"error": "Not found"}).encode()
+_INTERNAL_ERROR_BODY = json.dumps({"error": "Internal server error"}).encode()
+
+# Upper bound on tokens held in memory; the least recently used go first
+MAX_ACTIVE_TOKENS = 100_000
+
+class AudioFileResponse(FileResponse):
+    """FileResponse that reads recordings in 1 MiB chunks instead of 64 KiB
+    
+    Each chunk is a separate read() in a worker thread, so larger chunks cut
+    syscalls and thread hand-offs for multi-megabyte audio files.
+    """
+    chunk_size = 1024 * 1024
+
+class DownloadTokenConvertor(Convertor):
+    """Path convertor matching only the 43-character urlsafe tokens we issue
+    
+    Anything else fails to route at all, so malformed tokens never reach the
+    download handler.
+    """
+    regex = "[A-Za-z0-9_-]{43}"
+    
+    def convert(self, value: str) -> str:
+        return value
+    
+    def to_string(self, value: str) -> str:
+        return value
+
+register_url_convertor("download_token", DownloadTokenConvertor())
+
+def _token_key(token: str) -> bytes:
+    """Fixed-size digest of a token, used as its key in the token store"""
+    return hashlib.blake2b(token.encode('utf-8'), digest_size=16).digest()
+
+def _token_ttu(_key: bytes, token_info: Dict, now: float) -> float:
+    """TLRUCache time-to-use: each token lives for its own requested lifetime"""
+    return now + (token_info['expires_at'] - token_info['created_at']).total_seconds()
+
 class FileServer:
     """Simple file server for serving audio recordings with token-based access"""
     
     def __init__(self, recordings_path: str, jwt_secret: str = None):
         self.recordings_path = Path(recordings_path)
+        # Resolved once; download paths are checked against it without re-resolving
+        self._recordings_root = self.recordings_path.resolve()
         self.app = FastAPI(title="Discord Voice Recording Server")
         self.server = None
         
-        # Token storage: token -> {file_path, expires_at, recording_id}
-        self.active_tokens: Dict[str, Dict] = {}
+        # Serialized /health body and the monotonic time it goes stale
+        self._health_bytes = b''
+        self._health_expires = 0.0
+        
+        # Token storage: blake2b(token) -> {file_path, expires_at, recording_id}
+        # Expired tokens are evicted by the cache itself
+        self.active_tokens: TLRUCache = TLRUCache(maxsize=MAX_ACTIVE_TOKENS, ttu=_token_ttu)
         
         # Setup routes
         self.setup_routes()
@@ -29,79 +91,111 @@ class FileServer:
     def setup_routes(self):
         """Setup FastAPI routes"""
         
-        @self.app.get("/health")
+        @self.app.get("/health", response_class=Response)
         async def health_check():
-            """Health check endpoint"""
-            return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
+            """Health check endpoint; the body is rebuilt at most once a second"""
+            now = time.monotonic()
+            if now >= self._health_expires:
+                self._health_bytes = json.dumps(
+                    {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
+                ).encode()
+                self._health_expires = now + 1.0
+            return Response(content=self._health_bytes, media_type="application/json")
         
-        @self.app.get("/download/{token}")
+        @self.app.get("/download/{token:download_token}", response_class=AudioFileResponse)
         async def download_file(token: str):
             """Download file with simple token authentication"""
             try:
-                # Check if token exists
-                if token not in self.active_tokens:
-                    raise HTTPException(status_code=404, detail="File not found")
-                
-                token_info = self.active_tokens[token]
-                
-                # Check if token is still valid
-                if datetime.utcnow() > token_info['expires_at']:
-                    # Clean up expired token
-                    del self.active_tokens[token]
+                # Check if token exists; expired tokens are never returned
+                token_info = self.active_tokens.get(_token_key(token))
+                if token_info is None:
                     raise HTTPException(status_code=404, detail="File not found")
                 
-                # Get file path
-                file_path = Path(token_info['file_path'])
-                
-                # Security check: ensure file is within recordings directory
-                if not file_path.is_absolute():
-                    file_path = self.recordings_path / file_path
-                
-                # Resolve path and check it's within recordings directory
-                file_path = file_path.resolve()
-                if not str(file_path).startswith(str(self.recordings_path.resolve())):
-                    raise HTTPException(status_code=404, detail="File not found")
+                # Reuse the path verified by an earlier download with this token
+                # Resolving and stat-ing hit the filesystem, so both run off the event loop
+                file_path = token_info.get('resolved_path')
+                if file_path is None:
+                    located = await asyncio.to_thread(self._locate_recording, token_info['file_path'])
+                    if located is None:
+                        raise HTTPException(status_code=404, detail="File not found")
+                    file_path, stat_result = located
+                    
+                    # Only paths that passed the check are remembered
+                    token_info['resolved_path'] = file_path
+                else:
+                    try:
+                        stat_result = await asyncio.to_thread(os.stat, file_path)
+                    except OSError:
+                        raise HTTPException(status_code=404, detail="File not found")
                 
-                # Check if file exists
-                if not file_path.exists():
+                # The stat answers both "exists" and "is a regular file", and is
+                # handed to FileResponse so it doesn't stat the file again
+                if not stat.S_ISREG(stat_result.st_mode):
                     raise HTTPException(status_code=404, detail="File not found")
                 
                 # Return file
-                return FileResponse(
+                return AudioFileResponse(
                     path=str(file_path),
-                    filename=f"recording_{token_info['recording_id']}.{file_path.suffix.lstrip('.')}",
-                    media_type='audio/mpeg' if file_path.suffix == '.mp3' else 'audio/wav'
+                    stat_result=stat_result,
+                    filename=token_info['filename'],
+                    media_type=token_info['media_type']
                 )
                 
             except Exception as e:
-                logger.error(f"Error serving file: {e}")
+                logger.error("Error serving file: %s", e)
                 raise HTTPException(status_code=404, detail="File not found")
         
         @self.app.exception_handler(404)
         async def not_found_handler(request: Request, exc):
-            return {"error": "Not found"}
+            return Response(content=_NOT_FOUND_BODY, status_code=404, media_type="application/json")
         
         @self.app.exception_handler(500)
         async def internal_error_handler(request: Request, exc):
-            return {"error": "Internal server error"}
+            return Response(content=_INTERNAL_ERROR_BODY, status_code=500, media_type="application/json")
+    
+    def _locate_recording(self, file_path: str) -> Optional[Tuple[Path, os.stat_result]]:
+        """Resolve and stat a token's file path
+        
+        Returns None if the path escapes the recordings directory or doesn't exist.
+        """
+        path = Path(file_path)
+        
+        # Security check: ensure file is within recordings directory
+        if not path.is_absolute():
+            path = self._recordings_root / path
+        
+        # Resolve path and check it's within recordings directory
+        path = path.resolve()
+        if not path.is_relative_to(self._recordings_root):
+            return None
+        
+        try:
+            return path, path.stat()
+        except OSError:
+            return None
     
     def generate_download_token(self, recording_id: int, file_path: str, 
                               user_id: int, expires_hours: int = 1) -> str:
         """Generate a random download token"""
         # Generate a long, random token (256 bits = 43 characters base64)
         token = secrets.token_urlsafe(32)
-        expires_at = datetime.utcnow() + timedelta(hours=expires_hours)
+        created_at = datetime.utcnow()
+        expires_at = created_at + timedelta(hours=expires_hours)
+        suffix = Path(file_path).suffix.lower()
         
-        # Store token info in memory
-        self.active_tokens[token] = {
+        # Store token info in memory, with the response headers precomputed
+        # Keyed by digest so lookups never compare attacker-supplied strings
+        self.active_tokens[_token_key(token)] = {
             'recording_id': recording_id,
             'file_path': file_path,
             'user_id': user_id,
             'expires_at': expires_at,
-            'created_at': datetime.utcnow()
+            'created_at': created_at,
+            'filename': f"recording_{recording_id}{suffix}",
+            'media_type': MEDIA_TYPES.get(suffix, 'application/octet-stream')
         }
         
-        logger.info(f"Generated download token for recording {recording_id}, user {user_id}, expires in {expires_hours}h")
+        logger.info("Generated download token for recording %s, user %s, expires in %sh", recording_id, user_id, expires_hours)
         return token
     
     def get_download_url(self, token: str, base_url: str = "http://localhost:8000") -> str:
@@ -122,7 +216,7 @@ class FileServer:
         
         # Start server in background
         asyncio.create_task(self.server.serve())
-        logger.info(f"File server started on {host}:{port}")
+        logger.info("File server started on %s:%s", host, port)
     
     async def stop(self):
         """Stop the file server"""
@@ -131,21 +225,21 @@ class FileServer:
             logger.info("File server stopped")
     
     def cleanup_expired_tokens(self) -> int:
-        """Remove expired tokens from memory"""
-        now = datetime.utcnow()
-        expired_tokens = [
-            token for token, info in self.active_tokens.items() 
-            if info['expires_at'] < now
-        ]
+        """Remove expired tokens from memory
         
-        for token in expired_tokens:
-            del self.active_tokens[token]
+        The cache already drops expired tokens as it is used; this just purges
+        any that haven't been touched since.
+        """
+        before = len(self.active_tokens)
+        self.active_tokens.expire()
+        expired_count = before - len(self.active_tokens)
         
-        if expired_tokens:
-            logger.info(f"Cleaned up {len(expired_tokens)} expired download tokens")
+        if expired_count:
+            logger.info("Cleaned up %d expired download tokens", expired_count)
         
-        return len(expired_tokens)
+        return expired_count
     
     def get_active_token_count(self) -> int:
         """Get number of active tokens"""
+        self.active_tokens.expire()
         return len(self.active_tokens)
\ No newline at end of file